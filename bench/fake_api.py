@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+# === Fake Telegram Bot API ===
+# Replies that arrive ahead of the one a user is waiting for
+NOTICE_PREFIXES = ("🔥 It's a match",)
+
+
+class FakeTelegramAPI:
+    """Minimal Bot API server that answers every call and records what the bot sent.
+
+    The benchmark registers a waiter for a chat with expect(chat_id); the next
+    reply to that chat resolves it. Deletes and match notices don't count as
+    replies. Answered messages, photos and deletes are logged in ``sent`` as
+    (method, chat_id, text). ``latency`` delays every answer. With
+    ``flood_every=n``, every n-th call gets a 429 with ``retry_after`` set.
+    """
+
+    def __init__(self, latency=0.0, flood_every=0, retry_after=1):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.floods = 0
+        self.last_card = {}
+        self.sent = []
+        self._waiters = {}
+        self._message_id = 0
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+
+    def expect(self, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = (time.perf_counter(), future)
+        return future
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and sum(self.calls.values()) % self.flood_every == 0:
+            self.floods += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        if method not in ("sendMessage", "sendPhoto", "deleteMessage"):
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(data["chat_id"])
+        self.sent.append((method, chat_id, data.get("text") or data.get("caption")))
+        if method == "deleteMessage":
+            return web.json_response({"ok": True, "result": True})
+        if method == "sendPhoto":
+            markup = json.loads(data.get("reply_markup") or "{}")
+            buttons = [button for row in markup.get("inline_keyboard", []) for button in row]
+            self.last_card[chat_id] = next(
+                (button["callback_data"].split(":", 1)[1] for button in buttons if button["callback_data"].startswith("like:")),
+                None,
+            )
+        elif not data.get("text", "").startswith(NOTICE_PREFIXES):
+            self.last_card[chat_id] = None
+
+        if not data.get("text", "").startswith(NOTICE_PREFIXES):
+            waiter = self._waiters.pop(chat_id, None)
+            if waiter is not None and not waiter[1].done():
+                waiter[1].set_result(time.perf_counter() - waiter[0])
+
+        self._message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }})
@@ -0,0 +1,382 @@
+"""Load test for the webhook bot against a fake Telegram Bot API.
+
+Usage (from the repository root):
+
+    python -m bench.run --profiles 100000 --users 200 --swipes 20
+    python -m bench.run --replay updates.jsonl --rate 500
+
+Each virtual user goes through onboarding, sends /find, then swipes on the
+cards it gets. A share of them (--heavy) start with --heavy-history profiles
+already swiped, and their /find and swipes are reported separately. Latency
+is measured from the webhook POST to the bot's reply arriving at the fake
+API. With --replay, raw Telegram updates (one JSON object per line) are
+posted at a fixed rate. The report then shows webhook ack latency and how
+fast the bot worked through the updates.
+
+By default the outbox is unthrottled, so the numbers measure the handlers,
+the queries and the database rather than Telegram's rate limits. Pass
+--production-limits to keep the bot's OUTBOX_* values; --chat-rate,
+--chat-burst and --global-rate override single limits either way. After the
+client-side report, handler and (sampled) SQL timings are read back from the
+bot's /metrics.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from bench.fake_api import FakeTelegramAPI
+from bench.seed import seed
+
+BOT_TOKEN = "123456:BENCHMARK"
+SECRET = "bench-secret"
+USER_ID_BASE = 10 ** 9
+# Outbox limits high enough that delivery never waits on a token bucket
+UNTHROTTLED = {"OUTBOX_CHAT_RATE": 1000, "OUTBOX_CHAT_BURST": 100, "OUTBOX_GLOBAL_RATE": 100000}
+
+ONBOARDING = (
+    {"text": "/start"},
+    {"text": "bench"},
+    {"text": "👨 Man"},
+    {"text": "👩 Women"},
+    {"photo": [{"file_id": "bench-photo", "file_unique_id": "bench", "width": 1, "height": 1}]},
+    {"text": "just benchmarking"},
+    None,  # location, filled in per user
+)
+
+
+# === Report ===
+def summarize(name, latencies, wall):
+    if not latencies:
+        return {"scenario": name, "count": 0}
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "count": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "updates_per_s": len(latencies) / wall if wall else 0.0,
+    }
+
+
+METRIC_LINE = re.compile(r'^(?P<name>\w+?)(?P<suffix>_bucket|_sum|_count)(?:\{(?P<labels>.*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_histogram(text, name):
+    """Buckets, sum and count of histogram ``name`` in a /metrics scrape, by its label value."""
+    series = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match is None or match["name"] != name:
+            continue
+        labels = dict(LABEL.findall(match["labels"] or ""))
+        bound = labels.pop("le", None)
+        entry = series.setdefault(next(iter(labels.values()), ""), {"buckets": [], "sum": 0.0, "count": 0})
+        if match["suffix"] == "_bucket":
+            entry["buckets"].append((float(bound), float(match["value"])))
+        elif match["suffix"] == "_sum":
+            entry["sum"] = float(match["value"])
+        else:
+            entry["count"] = int(float(match["value"]))
+    return series
+
+
+def _bucket_quantile(entry, q):
+    # Upper bound of the bucket holding the q-th observation
+    for bound, cumulative in entry["buckets"]:
+        if cumulative >= q * entry["count"]:
+            return bound
+    return float("inf")
+
+
+def summarize_histogram(text, name, limit=None):
+    rows = [
+        {
+            "name": key,
+            "count": entry["count"],
+            "mean_ms": entry["sum"] / entry["count"] * 1000,
+            "p50_ms": _bucket_quantile(entry, 0.5) * 1000,
+            "p99_ms": _bucket_quantile(entry, 0.99) * 1000,
+            "total_ms": entry["sum"] * 1000,
+        }
+        for key, entry in parse_histogram(text, name).items() if entry["count"]
+    ]
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows[:limit]
+
+
+def print_server_report(title, rows, width=24):
+    print(f"\n{title:<{width}}{'count':>8}{'mean ms':>10}{'p50<= ms':>10}{'p99<= ms':>10}{'total ms':>10}")
+    for row in rows:
+        print(f"{row['name'][:width - 1]:<{width}}{row['count']:>8}{row['mean_ms']:>10.1f}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['total_ms']:>10.0f}")
+
+
+def print_report(rows):
+    print(f"{'scenario':<12}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'upd/s':>10}")
+    for row in rows:
+        if not row["count"]:
+            print(f"{row['scenario']:<12}{0:>8}")
+            continue
+        print(f"{row['scenario']:<12}{row['count']:>8}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}{row['updates_per_s']:>10.1f}")
+
+
+# === Updates ===
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+
+    def message(self, user_id, **payload):
+        self.update_id += 1
+        return {"update_id": self.update_id, "message": {
+            "message_id": self.update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            **payload,
+        }}
+
+    def callback(self, user_id, data):
+        self.update_id += 1
+        return {"update_id": self.update_id, "callback_query": {
+            "id": str(self.update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": self.update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": int(BOT_TOKEN.split(":")[0]), "is_bot": True, "first_name": "bot"},
+            },
+        }}
+
+
+class Runner:
+    def __init__(self, session, url, api, timeout):
+        self.session = session
+        self.url = url
+        self.api = api
+        self.timeout = timeout
+        self.timeouts = 0
+
+    async def post(self, update):
+        async with self.session.post(self.url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+            return response.status
+
+    async def round_trip(self, user_id, update):
+        reply = self.api.expect(user_id)
+        await self.post(update)
+        try:
+            return await asyncio.wait_for(reply, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+
+class UpdateCounter:
+    """Dispatcher middleware counting updates that finished, however they were delivered."""
+
+    def __init__(self):
+        self.handled = 0
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            self.handled += 1
+
+
+# === Scenarios ===
+def heavy_swipers(users, share):
+    """Ids of the virtual users that start with a long swipe history."""
+    return [USER_ID_BASE + i for i in range(round(users * share))]
+
+
+async def run_users(runner, users, swipes, center, rng, heavy=()):
+    factory = UpdateFactory()
+    scenarios = ("onboarding", "find", "find-heavy", "swipe", "swipe-heavy")
+    results = {name: [] for name in scenarios}
+    walls = {}
+    user_ids = [USER_ID_BASE + i for i in range(users)]
+    heavy = set(heavy)
+
+    async def phase(name, work):
+        started = time.perf_counter()
+
+        async def timed(user_id):
+            return await work(user_id), time.perf_counter()
+
+        # Each group's rate runs until its own last user is done
+        for user_id, (latencies, finished) in zip(user_ids, await asyncio.gather(*(timed(user_id) for user_id in user_ids))):
+            scenario = f"{name}-heavy" if user_id in heavy and f"{name}-heavy" in results else name
+            results[scenario].extend(latency for latency in latencies if latency is not None)
+            walls[scenario] = max(walls.get(scenario, 0.0), finished - started)
+
+    async def onboard(user_id):
+        location = {"location": {"latitude": center[0] + rng.uniform(-0.5, 0.5), "longitude": center[1] + rng.uniform(-0.5, 0.5)}}
+        return [await runner.round_trip(user_id, factory.message(user_id, **(step or location))) for step in ONBOARDING]
+
+    async def find(user_id):
+        return [await runner.round_trip(user_id, factory.message(user_id, text="/find"))]
+
+    async def swipe(user_id):
+        latencies = []
+        for _ in range(swipes):
+            card = runner.api.last_card.get(user_id)
+            if card is None:
+                break
+            action = "like" if rng.random() < 0.3 else "skip"
+            latencies.append(await runner.round_trip(user_id, factory.callback(user_id, f"{action}:{card}")))
+        return latencies
+
+    await phase("onboarding", onboard)
+    # Give the FSM write-behind buffer and the outbox a moment before the next phase
+    await asyncio.sleep(0.1)
+    await phase("find", find)
+    await phase("swipe", swipe)
+    return [summarize(name, results[name], walls.get(name, 0.0)) for name in scenarios if results[name] or not name.endswith("-heavy")]
+
+
+async def run_replay(runner, path, rate, counter):
+    with open(path) as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    acks = []
+    handled_before = counter.handled
+    interval = 1 / rate if rate else 0
+
+    async def send(update):
+        started = time.perf_counter()
+        if await runner.post(update) == 200:
+            acks.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tasks = []
+    for i, update in enumerate(updates):
+        tasks.append(asyncio.create_task(send(update)))
+        if interval:
+            await asyncio.sleep(max(0.0, started + (i + 1) * interval - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    while counter.handled - handled_before < len(acks) and time.perf_counter() - started < runner.timeout + len(updates) * interval:
+        await asyncio.sleep(0.01)
+    wall = time.perf_counter() - started
+
+    row = summarize("replay-ack", acks, wall)
+    row["updates_per_s"] = (counter.handled - handled_before) / wall
+    row["rejected"] = len(updates) - len(acks)
+    return [row]
+
+
+# === Main ===
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="incognito-bench-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+
+    api = FakeTelegramAPI(latency=args.api_latency / 1000, flood_every=args.flood_every)
+    api_runner = web.AppRunner(api.app)
+    await api_runner.setup()
+    api_site = web.TCPSite(api_runner, "127.0.0.1", 0)
+    await api_site.start()
+    api_port = api_runner.addresses[0][1]
+
+    # bot.py reads its configuration at import time
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "WEBHOOK_SECRET": SECRET,
+        "BASE_WEBHOOK_URL": "http://127.0.0.1",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "DB_NAME": db_path,
+        "WEBHOOK_MODE": args.mode,
+        "METRICS_SQL_SAMPLE": str(args.sql_sample),
+    })
+    if not args.production_limits:
+        os.environ.update({name: str(value) for name, value in UNTHROTTLED.items()})
+    for name, value in (("OUTBOX_CHAT_RATE", args.chat_rate), ("OUTBOX_CHAT_BURST", args.chat_burst), ("OUTBOX_GLOBAL_RATE", args.global_rate)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    heavy = []
+    if args.profiles and not args.db:
+        heavy = heavy_swipers(args.users, args.heavy) if args.heavy_history else []
+        started = time.perf_counter()
+        # Leave heavy swipers half the population to find cards in
+        history = min(args.heavy_history, args.profiles // 2)
+        await seed(db_path, args.profiles, args.history, args.seed, {user_id: history for user_id in heavy})
+        print(f"Seeded {args.profiles} profiles in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    import bot
+
+    app = await bot.main()
+    app_runner = web.AppRunner(app)
+    await app_runner.setup()
+    site = web.TCPSite(app_runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{app_runner.addresses[0][1]}{bot.WEBHOOK_PATH}"
+    counter = UpdateCounter()
+    bot.dp.update.outer_middleware(counter)
+
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            runner = Runner(session, url, api, args.timeout)
+            if args.replay:
+                rows = await run_replay(runner, args.replay, args.rate, counter)
+            else:
+                rows = await run_users(runner, args.users, args.swipes, (25.03, 55.15), random.Random(args.seed), heavy)
+            metrics_url = f"http://127.0.0.1:{app_runner.addresses[0][1]}{bot.METRICS_PATH}"
+            async with session.get(metrics_url) as response:
+                scrape = await response.text()
+            if args.metrics:
+                with open(args.metrics, "w") as f:
+                    f.write(scrape)
+    finally:
+        await app_runner.cleanup()
+        await api_runner.cleanup()
+
+    handlers = summarize_histogram(scrape, "bot_handler_seconds")
+    sql = summarize_histogram(scrape, "bot_sql_seconds", limit=10)
+    print_report(rows)
+    print_server_report("handler", handlers)
+    print_server_report(f"sql (sampled {args.sql_sample:g})", sql, width=60)
+    print(f"timeouts={runner.timeouts} api_calls={dict(api.calls)} floods={api.floods} "
+          f"update_queue={bot.update_queue.stats()}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"scenarios": rows, "handlers": handlers, "sql": sql}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the webhook bot against a fake Telegram API.")
+    parser.add_argument("--profiles", type=int, default=10000, help="synthetic profiles to seed (10k to 1M)")
+    parser.add_argument("--history", type=int, default=20, help="swipes (likes and skips) made by each seeded profile")
+    parser.add_argument("--heavy", type=float, default=0.1, help="share of virtual users that start with a long swipe history")
+    parser.add_argument("--heavy-history", type=int, default=2000, help="profiles already swiped by each heavy virtual user (at most half of --profiles)")
+    parser.add_argument("--db", help="use an existing database instead of seeding a fresh one")
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users")
+    parser.add_argument("--swipes", type=int, default=20, help="swipes per virtual user")
+    parser.add_argument("--replay", help="JSONL file of raw Telegram updates to replay")
+    parser.add_argument("--rate", type=float, default=0, help="replay rate in updates/s (0 = as fast as possible)")
+    parser.add_argument("--mode", choices=("queued", "inline"), default="queued", help="WEBHOOK_MODE of the bot")
+    parser.add_argument("--api-latency", type=float, default=0, help="fake API response delay in ms")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every n-th API call with a 429")
+    parser.add_argument("--production-limits", action="store_true", help="keep the bot's OUTBOX_* limits instead of an unthrottled outbox")
+    parser.add_argument("--chat-rate", type=float, help="override OUTBOX_CHAT_RATE for the run")
+    parser.add_argument("--chat-burst", type=int, help="override OUTBOX_CHAT_BURST for the run")
+    parser.add_argument("--global-rate", type=float, help="override OUTBOX_GLOBAL_RATE for the run")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connections to the webhook")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds to wait for each reply")
+    parser.add_argument("--sql-sample", type=float, default=0.1, help="METRICS_SQL_SAMPLE for the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report as JSON to this path")
+    parser.add_argument("--metrics", help="save the bot's /metrics scrape after the run to this path")
+    asyncio.run(main(parser.parse_args()))
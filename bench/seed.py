@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+
+# === Synthetic population ===
+GENDERS = ("Male", "Female", "Other")
+INTERESTS = ("Men", "Women", "Both")
+CENTER = (25.03, 55.15)
+SPREAD_DEG = 1.0
+CHUNK = 10000
+# Share of seeded swipes that are likes, as in the benchmark's virtual users
+LIKE_SHARE = 0.3
+
+
+async def create_schema(path):
+    import bot
+    from db import Database
+
+    database = Database(path, pool_size=1)
+    await database.open()
+    try:
+        await bot.create_db(database)
+    finally:
+        await database.close()
+
+
+async def seed(path, profiles, history=20, random_seed=0, swipers=None):
+    """Create the bot schema in ``path`` and fill it with a synthetic population."""
+    await create_schema(path)
+    await asyncio.to_thread(seed_population, path, profiles, history, random_seed, swipers)
+
+
+def seed_population(path, profiles, history=20, random_seed=0, swipers=None, center=CENTER, spread=SPREAD_DEG):
+    """Insert ``profiles`` users (ids 1..profiles) and ``history`` swipes by each.
+
+    Profiles are scattered uniformly within ``spread`` degrees of ``center``.
+    ``swipers`` maps further user ids, such as the benchmark's virtual users
+    who have no profile yet, to the number of profiles they have already
+    swiped on. Swipes are likes or skips and go into the swipes table like
+    the bot's own, so the triggers fill likes, matches and the R*Tree index.
+    """
+    rng = random.Random(random_seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        for start in range(1, profiles + 1, CHUNK):
+            conn.executemany(
+                "INSERT OR REPLACE INTO users (user_id, gender, interested_in, photo_id, bio, location, lat, lon) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (_profile(rng, user_id, center, spread) for user_id in range(start, min(start + CHUNK, profiles + 1))),
+            )
+            conn.commit()
+        for start in range(1, profiles + 1, CHUNK):
+            _insert_swipes(conn, (
+                (swiper_id, _other(rng, swiper_id, profiles), _action(rng))
+                for swiper_id in range(start, min(start + CHUNK, profiles + 1))
+                for _ in range(history)
+            ))
+        for swiper_id, count in (swipers or {}).items():
+            _insert_swipes(conn, (
+                (swiper_id, target_id, _action(rng))
+                for target_id in rng.sample(range(1, profiles + 1), min(count, profiles))
+            ))
+    finally:
+        conn.close()
+
+
+def _insert_swipes(conn, rows):
+    conn.executemany(
+        "INSERT OR IGNORE INTO swipes (swiper_id, target_id, action, ts) VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))",
+        rows,
+    )
+    conn.commit()
+
+
+def _action(rng):
+    return "like" if rng.random() < LIKE_SHARE else "skip"
+
+
+def _other(rng, user_id, profiles):
+    other = rng.randint(1, profiles - 1)
+    return other + 1 if other >= user_id else other
+
+
+def _profile(rng, user_id, center, spread):
+    lat = center[0] + rng.uniform(-spread, spread)
+    lon = center[1] + rng.uniform(-spread, spread)
+    return (user_id, rng.choice(GENDERS), rng.choice(INTERESTS), f"photo-{user_id}", f"bio {user_id}", f"{lat},{lon}", lat, lon)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed users/swipes with a synthetic population.")
+    parser.add_argument("db", help="SQLite database to seed (created if missing)")
+    parser.add_argument("--profiles", type=int, default=10000)
+    parser.add_argument("--history", type=int, default=20, help="swipes (likes and skips) made by each profile")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(seed(args.db, args.profiles, args.history, args.seed))
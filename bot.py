@@ -1,7 +1,9 @@
 import os
+import math
 import asyncio
-import aiosqlite
 from aiogram import Bot, Dispatcher, Router, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import (
     Message, CallbackQuery,
     ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove,
@@ -9,27 +11,107 @@ from aiogram.types import (
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.filters import Command, StateFilter
 from aiohttp import web
-from aiogram.webhook.aiohttp_server import setup_application
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
 
+from candidates import CandidateQueue
+from db import Database, DatabaseMiddleware
+from metrics import ApiTimingMiddleware, HandlerTimingMiddleware, Registry, SQLProfiler
+from outbox import Outbox
+from storage import SQLiteStorage, create_storage
+from updates import QueuedRequestHandler, UpdateQueue
+
 # === Load environment variables ===
 load_dotenv()
 API_TOKEN = os.getenv("BOT_TOKEN")
+# Alternative Bot API server, e.g. a local one or the benchmark's fake API
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 BASE_WEBHOOK_URL = os.getenv("BASE_WEBHOOK_URL", "https://incognito-bot.onrender.com")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "supersecret123456")
 WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
-DB_NAME = "users.db"
+# "queued" acks the webhook at once and hands updates to a worker pool; "inline" handles them in the request
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queued")
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+# Prometheus-style metrics; SQL timings are taken on a sample of connection checkouts
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_SQL_SAMPLE = float(os.getenv("METRICS_SQL_SAMPLE", 0.1))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+DB_NAME = os.getenv("DB_NAME", "users.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DB_CACHE_KIB = int(os.getenv("DB_CACHE_KIB", 16384))
+# FSM storage: "sqlite" (default), "memory", or a redis:// URL shared by all workers
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 7 * 24 * 3600))
+# SQLite FSM writes are buffered per process; set 0 to write through when several processes share the database
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 0.5))
+
+# === Matching ===
+# Search radii for /find, nearest first; the search widens to the next step
+# only when nothing is left inside the current one. Past the last radius it
+# takes anyone, still nearest first, so distant users still get cards.
+MATCH_RADII_KM = tuple(float(r) for r in os.getenv("MATCH_RADII_KM", "5,25,100,500").split(","))
+KM_PER_DEGREE = 111.32
+# A little wider than the globe, since the R*Tree rounds its boxes outwards
+WORLD_BOX = (-91.0, 91.0, -181.0, 181.0)
+# Per-user queue of ranked cards so a swipe doesn't rerun the match query
+CANDIDATE_BATCH = int(os.getenv("CANDIDATE_BATCH", 20))
+CANDIDATE_LOW_WATER = int(os.getenv("CANDIDATE_LOW_WATER", 5))
+CANDIDATE_TTL = float(os.getenv("CANDIDATE_TTL", 300))
+CANDIDATE_MAX_USERS = int(os.getenv("CANDIDATE_MAX_USERS", 10000))
+MATCHES_PAGE_SIZE = int(os.getenv("MATCHES_PAGE_SIZE", 10))
+
+# Keyboard labels -> stored values
+GENDER_LABELS = {"👨 Man": "Male", "👩 Woman": "Female", "🏳️ Other": "Other"}
+INTEREST_LABELS = {"👩 Women": "Women", "👨 Men": "Men", "🔀 Both": "Both"}
+
+# What a profile's "interested_in" accepts, and how a gender reads in it
+WANTED_GENDERS = {"Women": ("Female",), "Men": ("Male",), "Both": ("Male", "Female", "Other")}
+SEEKING_LABEL = {"Male": "Men", "Female": "Women", "Other": "Both"}
+
+# Outbound Bot API calls go through a rate-limited background queue
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", 8))
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", 25))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", 1))
+OUTBOX_CHAT_BURST = int(os.getenv("OUTBOX_CHAT_BURST", 5))
 
 # === Bot & Dispatcher Setup ===
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+metrics = Registry()
+bot = Bot(
+    token=API_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+)
+bot.session.middleware(ApiTimingMiddleware(metrics))
+outbox = Outbox(
+    bot,
+    concurrency=OUTBOX_CONCURRENCY,
+    global_rate=OUTBOX_GLOBAL_RATE,
+    chat_rate=OUTBOX_CHAT_RATE,
+    chat_burst=OUTBOX_CHAT_BURST,
+)
+sql_profiler = SQLProfiler(metrics, sample_rate=METRICS_SQL_SAMPLE, slow_ms=SLOW_QUERY_MS)
+database = Database(DB_NAME, pool_size=DB_POOL_SIZE, cache_kib=DB_CACHE_KIB, profiler=sql_profiler)
+storage = create_storage(FSM_STORAGE, database, state_ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL)
 dp = Dispatcher(storage=storage)
+update_queue = UpdateQueue(dp, bot, workers=UPDATE_WORKERS, max_size=UPDATE_QUEUE_SIZE)
+dp.update.outer_middleware(DatabaseMiddleware(database))
 router = Router()
+handler_timing = HandlerTimingMiddleware(metrics)
+router.message.middleware(handler_timing)
+router.callback_query.middleware(handler_timing)
 dp.include_router(router)
 
+metrics.gauge("bot_outbox_pending", "Outbound API calls waiting to be sent.", lambda: outbox.pending)
+metrics.gauge("bot_update_queue_depth", "Updates waiting for a worker.", lambda: update_queue.depth)
+metrics.gauge("bot_update_queue_max_depth", "Highest update queue depth seen.", lambda: update_queue.max_depth)
+metrics.gauge("bot_updates_received_total", "Webhook updates received.", lambda: update_queue.received, kind="counter")
+metrics.gauge("bot_updates_rejected_total", "Webhook updates turned away because the queue was full.", lambda: update_queue.rejected, kind="counter")
+metrics.gauge("bot_updates_processed_total", "Updates processed by the worker pool.", lambda: update_queue.processed, kind="counter")
+metrics.gauge("bot_updates_failed_total", "Updates whose processing raised.", lambda: update_queue.failed, kind="counter")
+metrics.gauge("bot_update_queue_wait_max_seconds", "Longest time an update waited in the queue.", lambda: update_queue.wait_max)
+
 # === States ===
 class Onboarding(StatesGroup):
     nickname = State()
@@ -40,8 +122,8 @@ class Onboarding(StatesGroup):
     location = State()
 
 # === DB Setup ===
-async def create_db():
-    async with aiosqlite.connect(DB_NAME) as db:
+async def create_db(database):
+    async with database.transaction() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
@@ -49,7 +131,9 @@ async def create_db():
                 interested_in TEXT,
                 photo_id TEXT,
                 bio TEXT,
-                location TEXT
+                location TEXT,
+                lat REAL,
+                lon REAL
             )
         """)
         await db.execute("""
@@ -59,27 +143,197 @@ async def create_db():
                 PRIMARY KEY (liker_id, liked_id)
             )
         """)
-        await db.commit()
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'swipes'") as cursor:
+            has_swipes = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS swipes (
+                swiper_id INTEGER,
+                target_id INTEGER,
+                action TEXT,
+                ts INTEGER,
+                PRIMARY KEY (swiper_id, target_id)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS swipes_target_idx ON swipes (target_id, swiper_id)")
+        if not has_swipes:
+            # Likes recorded before swipes existed still count as seen
+            await db.execute("""
+                INSERT OR IGNORE INTO swipes (swiper_id, target_id, action, ts)
+                SELECT liker_id, liked_id, 'like', CAST(strftime('%s', 'now') AS INTEGER) FROM likes
+            """)
+
+        # Matches are stored once per side so each user's list is a single index range
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'matches'") as cursor:
+            has_matches = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS matches (
+                user_id INTEGER,
+                match_id INTEGER,
+                created_at INTEGER,
+                PRIMARY KEY (user_id, match_id)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS matches_recent_idx ON matches (user_id, created_at, match_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS likes_liked_idx ON likes (liked_id, liker_id)")
+        if not has_matches:
+            await db.execute("""
+                INSERT OR IGNORE INTO matches (user_id, match_id, created_at)
+                SELECT a.liker_id, a.liked_id, CAST(strftime('%s', 'now') AS INTEGER) FROM likes AS a
+                JOIN likes AS b ON b.liker_id = a.liked_id AND b.liked_id = a.liker_id
+            """)
+
+        # A like swipe records the like, and a like that closes the loop records the match,
+        # all inside the statement that inserts the swipe
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS swipes_like AFTER INSERT ON swipes
+            WHEN new.action = 'like'
+            BEGIN
+                INSERT OR IGNORE INTO likes (liker_id, liked_id) VALUES (new.swiper_id, new.target_id);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS swipes_like_update AFTER UPDATE OF action ON swipes
+            WHEN new.action = 'like'
+            BEGIN
+                -- The upsert's conflict handling overrides OR IGNORE in here, so skip existing likes by hand
+                INSERT INTO likes (liker_id, liked_id) SELECT new.swiper_id, new.target_id
+                WHERE NOT EXISTS (SELECT 1 FROM likes WHERE liker_id = new.swiper_id AND liked_id = new.target_id);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS likes_match AFTER INSERT ON likes
+            WHEN EXISTS (SELECT 1 FROM likes WHERE liker_id = new.liked_id AND liked_id = new.liker_id)
+            BEGIN
+                INSERT OR IGNORE INTO matches (user_id, match_id, created_at) VALUES
+                    (new.liker_id, new.liked_id, CAST(strftime('%s', 'now') AS INTEGER)),
+                    (new.liked_id, new.liker_id, CAST(strftime('%s', 'now') AS INTEGER));
+            END
+        """)
+
+        # Databases created before lat/lon existed only have the "lat,lon" text
+        async with db.execute("PRAGMA table_info(users)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "lat" not in columns:
+            await db.execute("ALTER TABLE users ADD COLUMN lat REAL")
+            await db.execute("ALTER TABLE users ADD COLUMN lon REAL")
+            await db.execute("""
+                UPDATE users SET
+                    lat = CAST(substr(location, 1, instr(location, ',') - 1) AS REAL),
+                    lon = CAST(substr(location, instr(location, ',') + 1) AS REAL)
+                WHERE instr(location, ',') > 0
+            """)
+            # Some early profiles were saved with the raw keyboard labels
+            for label, value in GENDER_LABELS.items():
+                await db.execute("UPDATE users SET gender = ? WHERE gender = ?", (value, label))
+            for label, value in INTEREST_LABELS.items():
+                await db.execute("UPDATE users SET interested_in = ? WHERE interested_in = ?", (value, label))
+
+        # R*Tree over profile coordinates, kept in sync with users by triggers
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_geo USING rtree(
+                user_id, min_lat, max_lat, min_lon, max_lon
+            )
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_geo_insert AFTER INSERT ON users
+            WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL
+            BEGIN
+                INSERT OR REPLACE INTO users_geo VALUES (new.user_id, new.lat, new.lat, new.lon, new.lon);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_geo_update AFTER UPDATE OF lat, lon ON users
+            BEGIN
+                DELETE FROM users_geo WHERE user_id = old.user_id;
+                INSERT INTO users_geo SELECT new.user_id, new.lat, new.lat, new.lon, new.lon
+                WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_geo_delete AFTER DELETE ON users
+            BEGIN
+                DELETE FROM users_geo WHERE user_id = old.user_id;
+            END
+        """)
+        await db.execute("""
+            INSERT INTO users_geo
+            SELECT user_id, lat, lat, lon, lon FROM users
+            WHERE lat IS NOT NULL AND lon IS NOT NULL
+            AND user_id NOT IN (SELECT user_id FROM users_geo)
+        """)
+
+def bounding_box(lat, lon, radius_km):
+    if radius_km is None:
+        return WORLD_BOX
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+async def find_candidates(db, user_id, gender, interested_in, lat, lon, limit=1):
+    wanted = WANTED_GENDERS.get(interested_in, ())
+    if not wanted:
+        return []
+    seeking = SEEKING_LABEL.get(gender, "Both")
+    # Equirectangular distance is plenty for ranking within a few hundred km
+    lon_scale = math.cos(math.radians(lat)) ** 2
+
+    query = """
+    SELECT u.user_id, u.gender, u.photo_id, u.bio FROM users_geo AS g
+    JOIN users AS u ON u.user_id = g.user_id
+    WHERE g.min_lat >= ? AND g.max_lat <= ? AND g.min_lon >= ? AND g.max_lon <= ?
+    AND u.user_id != ?
+    AND u.gender IN ({})
+    AND u.interested_in IN (?, 'Both')
+    AND NOT EXISTS (SELECT 1 FROM swipes AS s WHERE s.swiper_id = ? AND s.target_id = u.user_id)
+    ORDER BY (u.lat - ?) * (u.lat - ?) + (u.lon - ?) * (u.lon - ?) * ?
+    LIMIT ?
+    """.format(",".join("?" * len(wanted)))
+
+    rows = []
+    for radius_km in (*MATCH_RADII_KM, None):
+        args = [*bounding_box(lat, lon, radius_km), user_id, *wanted, seeking, user_id,
+                lat, lat, lon, lon, lon_scale, limit]
+        async with db.execute(query, args) as cursor:
+            rows = await cursor.fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
+
+async def fetch_candidates(db, user_id, limit):
+    async with db.acquire() as conn:
+        async with conn.execute("SELECT gender, interested_in, lat, lon FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            user = await cursor.fetchone()
+        if not user or user[2] is None:
+            raise LookupError(user_id)
+        return await find_candidates(conn, user_id, *user, limit=limit)
+
+candidates = CandidateQueue(
+    fetch_candidates,
+    batch_size=CANDIDATE_BATCH,
+    low_water=CANDIDATE_LOW_WATER,
+    ttl=CANDIDATE_TTL,
+    max_users=CANDIDATE_MAX_USERS,
+)
 
 # === Handlers ===
 @router.message(Command("start"), StateFilter("*"))
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer("Hey, gorgeous 😘 What should I call you here? (Type your nickname)")
+    outbox.send_message(message.chat.id, "Hey, gorgeous 😘 What should I call you here? (Type your nickname)")
     await state.set_state(Onboarding.nickname)
 
 @router.message(Onboarding.nickname)
 async def process_nickname(message: Message, state: FSMContext):
     nickname = message.text.strip()
     if len(nickname) > 20:
-        await message.answer("That’s quite a long name! Keep it short & sweet, please.")
+        outbox.send_message(message.chat.id, "That’s quite a long name! Keep it short & sweet, please.")
         return
     await state.update_data(nickname=nickname)
 
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="👨 Man"), KeyboardButton(text="👩 Woman"), KeyboardButton(text="🏳️ Other")]
     ])
-    await message.answer("Lovely name! Now tell me, are you a 👨 Man, 👩 Woman, or something more intriguing?", reply_markup=kb)
+    outbox.send_message(message.chat.id, "Lovely name! Now tell me, are you a 👨 Man, 👩 Woman, or something more intriguing?", reply_markup=kb)
     await state.set_state(Onboarding.gender)
 
 @router.message(Onboarding.gender, F.text.in_(["👨 Man", "👩 Woman", "🏳️ Other"]))
@@ -90,131 +344,202 @@ async def process_gender(message: Message, state: FSMContext):
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="👩 Women"), KeyboardButton(text="👨 Men"), KeyboardButton(text="🔀 Both")]
     ])
-    await message.answer("Oooh, a lady of mystery! Who are you hoping to find here?", reply_markup=kb)
+    outbox.send_message(message.chat.id, "Oooh, a lady of mystery! Who are you hoping to find here?", reply_markup=kb)
     await state.set_state(Onboarding.interested_in)
 
 @router.message(Onboarding.interested_in, F.text.in_(["👩 Women", "👨 Men", "🔀 Both"]))
 async def process_interested_in(message: Message, state: FSMContext):
     await state.update_data(interested_in=message.text)
-    await message.answer("Perfect! Now, share a photo that'll make hearts skip a beat 💓", reply_markup=ReplyKeyboardRemove())
+    outbox.send_message(message.chat.id, "Perfect! Now, share a photo that'll make hearts skip a beat 💓", reply_markup=ReplyKeyboardRemove())
     await state.set_state(Onboarding.photo)
 
 @router.message(Onboarding.photo, F.photo)
 async def process_photo(message: Message, state: FSMContext):
     photo = message.photo[-1].file_id
     await state.update_data(photo_id=photo)
-    await message.answer("Got it! Now, tell me something naughty in your bio 😏")
+    outbox.send_message(message.chat.id, "Got it! Now, tell me something naughty in your bio 😏")
     await state.set_state(Onboarding.bio)
 
 @router.message(Onboarding.bio)
 async def process_bio(message: Message, state: FSMContext):
     bio = message.text.strip()
     if len(bio) > 200:
-        await message.answer("Whoa, too long! Keep it spicy but short, please.")
+        outbox.send_message(message.chat.id, "Whoa, too long! Keep it spicy but short, please.")
         return
     await state.update_data(bio=bio)
 
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="Share my location 📍", request_location=True)]
     ])
-    await message.answer("Almost done! Share your location discreetly so we can find local matches.", reply_markup=kb)
+    outbox.send_message(message.chat.id, "Almost done! Share your location discreetly so we can find local matches.", reply_markup=kb)
     await state.set_state(Onboarding.location)
 
 @router.message(Onboarding.location, F.location)
-async def process_location(message: Message, state: FSMContext):
-    location_str = f"{message.location.latitude},{message.location.longitude}"
+async def process_location(message: Message, state: FSMContext, db: Database):
+    lat, lon = message.location.latitude, message.location.longitude
     data = await state.get_data()
 
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("""
-            INSERT OR REPLACE INTO users (user_id, gender, interested_in, photo_id, bio, location)
-            VALUES (?, ?, ?, ?, ?, ?)
+    async with db.transaction() as conn:
+        await conn.execute("""
+            INSERT OR REPLACE INTO users (user_id, gender, interested_in, photo_id, bio, location, lat, lon)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             message.from_user.id,
-            data['gender'].replace("👨 Man", "Male").replace("👩 Woman", "Female").replace("🏳️ Other", "Other"),
-            data['interested_in'].replace("👩 Women", "Women").replace("👨 Men", "Men").replace("🔀 Both", "Both"),
+            GENDER_LABELS.get(data['gender'], data['gender']),
+            INTEREST_LABELS.get(data['interested_in'], data['interested_in']),
             data['photo_id'],
             data['bio'],
-            location_str
+            f"{lat},{lon}",
+            lat,
+            lon
         ))
-        await db.commit()
 
+    candidates.invalidate_profile(message.from_user.id)
     await state.clear()
-    await message.answer("You’re all set, darling 🔥 Use /find to discover your secret connections!", reply_markup=ReplyKeyboardRemove())
+    outbox.send_message(message.chat.id, "You’re all set, darling 🔥 Use /find to discover your secret connections!", reply_markup=ReplyKeyboardRemove())
 
 @router.message(Command("find"))
-async def find_matches(message: Message):
-    user_id = message.from_user.id
-
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT gender, interested_in, location FROM users WHERE user_id = ?", (user_id,)) as cursor:
-            user = await cursor.fetchone()
-            if not user:
-                await message.answer("Please create your profile using /start.")
-                return
-
-            gender, interested_in, location = user
-            lat, lon = map(float, location.split(","))
+async def find_matches(message: Message, db: Database):
+    await show_next_card(message.chat.id, message.from_user.id, db)
+
+async def show_next_card(chat_id, user_id, db):
+    try:
+        match = await candidates.next(db, user_id)
+    except LookupError:
+        outbox.send_message(chat_id, "Please create your profile using /start.")
+        return
 
-        async with db.execute("SELECT liked_id FROM likes WHERE liker_id = ?", (user_id,)) as cursor:
-            seen = [row[0] for row in await cursor.fetchall()]
+    if match:
+        send_card(chat_id, match)
+    else:
+        outbox.send_message(chat_id, "No matches found right now. Try again later.", dedupe_key="no-matches")
 
-        query = """
-        SELECT user_id, gender, photo_id, bio FROM users
-        WHERE user_id != ?
-        AND gender IN (?, 'Both')
-        AND interested_in IN (?, 'Both')
-        AND user_id NOT IN ({})
+def send_card(chat_id, card):
+    match_id, match_gender, photo_id, bio = card
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="❤️ Like", callback_data=f"like:{match_id}"),
+         InlineKeyboardButton(text="❌ Skip", callback_data=f"skip:{match_id}")]
+    ])
+    outbox.send_photo(chat_id, photo=photo_id, caption=f"{match_gender}\n\n{bio}", reply_markup=kb)
 
-        LIMIT 1
-        """.format(",".join("?" * len(seen)) if seen else "0")
+@router.message(Command("admirers"))
+async def find_admirers(message: Message, db: Database):
+    # Someone who liked you and you haven't swiped on yet, via the likes (liked_id, liker_id) index
+    user_id = message.from_user.id
+    async with db.acquire() as conn:
+        async with conn.execute("""
+            SELECT u.user_id, u.gender, u.photo_id, u.bio FROM likes AS l
+            JOIN users AS u ON u.user_id = l.liker_id
+            WHERE l.liked_id = ?
+            AND NOT EXISTS (SELECT 1 FROM swipes AS s WHERE s.swiper_id = ? AND s.target_id = l.liker_id)
+            LIMIT 1
+        """, (user_id, user_id)) as cursor:
+            admirer = await cursor.fetchone()
+
+    if admirer:
+        send_card(message.chat.id, admirer)
+    else:
+        outbox.send_message(message.chat.id, "No new admirers yet. Keep swiping 😉")
+
+@router.message(Command("matches"))
+async def list_matches(message: Message, db: Database):
+    await send_matches_page(message.chat.id, message.from_user.id, db)
+
+@router.callback_query(F.data.startswith("matches:"))
+async def page_matches(call: CallbackQuery, db: Database):
+    _, created_at, match_id = call.data.split(":")
+    await send_matches_page(call.message.chat.id, call.from_user.id, db, after=(int(created_at), int(match_id)))
+
+async def send_matches_page(chat_id, user_id, db, after=None):
+    # Keyset pagination, newest first: each page starts below the last (created_at, match_id) shown
+    first_page = after is None
+    after = after or (2 ** 62, 2 ** 62)
+    async with db.acquire() as conn:
+        rows = await conn.execute_fetchall("""
+            SELECT m.match_id, m.created_at, u.gender, u.bio FROM matches AS m
+            JOIN users AS u ON u.user_id = m.match_id
+            WHERE m.user_id = ? AND (m.created_at, m.match_id) < (?, ?)
+            ORDER BY m.created_at DESC, m.match_id DESC
+            LIMIT ?
+        """, (user_id, *after, MATCHES_PAGE_SIZE + 1))
+
+    if not rows:
+        outbox.send_message(chat_id, "No matches yet. Use /find to start swiping 🔥" if first_page else "That's all your matches!")
+        return
 
-        args = [user_id, interested_in, gender] + seen
-        async with db.execute(query, args) as cursor:
-            match = await cursor.fetchone()
-
-        if match:
-            match_id, match_gender, photo_id, bio = match
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❤️ Like", callback_data=f"like:{match_id}"),
-                 InlineKeyboardButton(text="❌ Skip", callback_data=f"skip:{match_id}")]
-            ])
-            await bot.send_photo(message.chat.id, photo=photo_id, caption=f"{match_gender}\n\n{bio}", reply_markup=kb)
-        else:
-            await message.answer("No matches found right now. Try again later.")
+    page = rows[:MATCHES_PAGE_SIZE]
+    text = "🔥 Your matches:\n\n" + "\n".join(f"• {gender} — {bio}" for _, _, gender, bio in page)
+    kb = None
+    if len(rows) > MATCHES_PAGE_SIZE:
+        last_id, last_created_at = page[-1][0], page[-1][1]
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="More ▶️", callback_data=f"matches:{last_created_at}:{last_id}")]
+        ])
+    outbox.send_message(chat_id, text, reply_markup=kb)
+
+async def record_swipe(db, user_id, target_id, action):
+    """Store a swipe and return True if it created a new match."""
+    # Triggers turn the swipe into a like and a match. A repeat of the same swipe
+    # changes nothing and returns no row. RETURNING sees likes as they were before
+    # the triggers ran, so only a like that is new and closes the loop is a new match
+    async with db.transaction() as conn:
+        rows = await conn.execute_fetchall("""
+            INSERT INTO swipes (swiper_id, target_id, action, ts)
+            VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+            ON CONFLICT (swiper_id, target_id) DO UPDATE SET action = excluded.action, ts = excluded.ts
+            WHERE swipes.action <> excluded.action
+            RETURNING action = 'like'
+                AND NOT EXISTS (SELECT 1 FROM likes AS l WHERE l.liker_id = swipes.swiper_id AND l.liked_id = swipes.target_id)
+                AND EXISTS (SELECT 1 FROM likes AS l WHERE l.liker_id = swipes.target_id AND l.liked_id = swipes.swiper_id)
+        """, (user_id, target_id, action))
+    return bool(rows and rows[0][0])
 
 @router.callback_query(F.data.startswith(("like:", "skip:")))
-async def handle_swipe(call: CallbackQuery):
+async def handle_swipe(call: CallbackQuery, db: Database):
     action, target_id = call.data.split(":")
     user_id = call.from_user.id
     target_id = int(target_id)
 
-    async with aiosqlite.connect(DB_NAME) as db:
-        if action == "like":
-            await db.execute("INSERT OR IGNORE INTO likes (liker_id, liked_id) VALUES (?, ?)", (user_id, target_id))
-            await db.commit()
+    is_match = await record_swipe(db, user_id, target_id, action)
+    candidates.discard(user_id, target_id)
 
-            async with db.execute("SELECT 1 FROM likes WHERE liker_id = ? AND liked_id = ?", (target_id, user_id)) as cursor:
-                if await cursor.fetchone():
-                    await bot.send_message(user_id, "🔥 It's a match!")
-                    await bot.send_message(target_id, "🔥 It's a match!")
+    if is_match:
+        outbox.send_message(user_id, "🔥 It's a match!", dedupe_key=f"match:{target_id}")
+        outbox.send_message(target_id, "🔥 It's a match!", dedupe_key=f"match:{user_id}")
 
-    await call.message.delete()
-    await find_matches(call.message)
+    outbox.delete_message(call.message.chat.id, call.message.message_id)
+    # call.message was sent by the bot, so its from_user is the bot, not the swiper
+    await show_next_card(call.message.chat.id, user_id, db)
 
 # === Webhook setup ===
 async def on_startup(app):
-    await create_db()
+    await database.open()
+    await create_db(database)
+    if isinstance(storage, SQLiteStorage):
+        await storage.open()
+    await outbox.start()
+    await update_queue.start()
     await bot.set_webhook(f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
 
 async def on_shutdown(app):
     await bot.delete_webhook()
+    await update_queue.drain()
+    await outbox.close()
+    await candidates.close()
+    await storage.close()
+    await database.close()
 
 async def main():
     app = web.Application()
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
-    setup_application(app, dp, bot=bot, path=WEBHOOK_PATH)
+    if WEBHOOK_MODE == "queued":
+        handler = QueuedRequestHandler(dp, bot, update_queue, secret_token=WEBHOOK_SECRET)
+    else:
+        handler = SimpleRequestHandler(dp, bot, handle_in_background=False, secret_token=WEBHOOK_SECRET)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get(METRICS_PATH, metrics.handle)
+    setup_application(app, dp, bot=bot)
     return app
 
 if __name__ == "__main__":
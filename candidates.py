@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+# === Candidate queue ===
+class _Entry:
+    __slots__ = ("cards", "on_screen", "expires_at", "refill")
+
+    def __init__(self, expires_at):
+        self.cards = deque()
+        self.on_screen = None
+        self.expires_at = expires_at
+        self.refill = None
+
+
+class CandidateQueue:
+    """Per-user queue of ranked candidate cards, refilled in batches.
+
+    ``fetch(db, user_id, limit)`` returns up to ``limit`` ranked cards, each a
+    tuple whose first item is the candidate's user_id. It raises LookupError
+    when the user has no profile. next() pops one card, which stays on screen
+    until discard() sees the matching swipe or next() hands out another. A
+    card that was shown but never swiped can come back in a later refill.
+    When the queue runs low, a background refill tops it up.
+
+    The queue lives in memory, so each worker process has its own copy. The
+    TTL limits how stale a queue can get when another process changes a
+    profile.
+    """
+
+    def __init__(self, fetch, batch_size=20, low_water=5, ttl=300, max_users=10000):
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+
+    async def next(self, db, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._drop(user_id)
+            entry = None
+        if entry is None:
+            entry = self._entries[user_id] = _Entry(time.monotonic() + self.ttl)
+            self._evict()
+        else:
+            self._entries.move_to_end(user_id)
+
+        if not entry.cards:
+            if entry.refill is None:
+                entry.refill = asyncio.ensure_future(self._refill(db, user_id, entry))
+            try:
+                await asyncio.shield(entry.refill)
+            except LookupError:
+                self._drop(user_id)
+                raise
+            if not entry.cards:
+                return None
+
+        card = entry.cards.popleft()
+        entry.on_screen = card[0]
+        if len(entry.cards) <= self.low_water and entry.refill is None:
+            entry.refill = asyncio.ensure_future(self._refill(db, user_id, entry))
+            entry.refill.add_done_callback(self._log_prefetch_error)
+        return card
+
+    def discard(self, user_id, target_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        if entry.on_screen == target_id:
+            entry.on_screen = None
+        if entry.cards and any(card[0] == target_id for card in entry.cards):
+            entry.cards = deque(card for card in entry.cards if card[0] != target_id)
+
+    def invalidate(self, user_id):
+        self._drop(user_id)
+
+    def invalidate_profile(self, user_id):
+        # The user's own ranking changes, and cached copies of their card are stale
+        self._drop(user_id)
+        for entry in self._entries.values():
+            if any(card[0] == user_id for card in entry.cards):
+                entry.cards = deque(card for card in entry.cards if card[0] != user_id)
+
+    async def close(self):
+        entries, self._entries = self._entries, OrderedDict()
+        for entry in entries.values():
+            if entry.refill is not None:
+                entry.refill.cancel()
+
+    async def _refill(self, db, user_id, entry):
+        try:
+            # Queued cards and the one on screen come back from the query too, so over-fetch by that many
+            known = {card[0] for card in entry.cards}
+            if entry.on_screen is not None:
+                known.add(entry.on_screen)
+            cards = await self.fetch(db, user_id, self.batch_size + len(known))
+            entry.cards.extend(card for card in cards if card[0] not in known)
+        finally:
+            entry.refill = None
+
+    def _drop(self, user_id):
+        # An in-flight refill is left to finish; it only fills the orphaned entry
+        self._entries.pop(user_id, None)
+
+    @staticmethod
+    def _log_prefetch_error(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Candidate prefetch failed", exc_info=task.exception())
+
+    def _evict(self):
+        while len(self._entries) > self.max_users:
+            self._drop(next(iter(self._entries)))
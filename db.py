@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+import aiosqlite
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+# === Connection pool ===
+class Database:
+    """A small pool of long-lived SQLite connections shared by all handlers.
+
+    Reads borrow any idle connection via acquire(). Writes go through
+    transaction(), which also takes a process-wide write lock. SQLite only
+    allows one writer at a time anyway, and taking turns here avoids
+    SQLITE_BUSY when one connection upgrades its read snapshot to a write.
+    """
+
+    def __init__(self, path, pool_size=4, cache_kib=16384, cached_statements=256, busy_timeout_ms=5000, profiler=None):
+        self.path = path
+        self.profiler = profiler
+        self.pool_size = pool_size
+        self.cache_kib = cache_kib
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self._connections = []
+        self._idle = None
+        self._write_lock = asyncio.Lock()
+
+    async def open(self):
+        self._idle = asyncio.Queue()
+        for _ in range(self.pool_size):
+            conn = await aiosqlite.connect(self.path, cached_statements=self.cached_statements)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            await conn.execute(f"PRAGMA cache_size=-{int(self.cache_kib)}")
+            await conn.execute("PRAGMA temp_store=MEMORY")
+            await conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            await conn.close()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        conn = await self._idle.get()
+        if self.profiler is not None:
+            self.profiler.record_wait(time.perf_counter() - started)
+        try:
+            if self.profiler is not None and self.profiler.sampled():
+                yield ProfiledConnection(conn, self.profiler)
+            else:
+                yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        async with self._write_lock, self.acquire() as conn:
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            await conn.commit()
+
+
+# === Statement profiling ===
+class ProfiledConnection:
+    """Wraps a pooled connection and reports every statement to a profiler.
+
+    The profiler needs a ``record(sql, seconds, rows)`` method. A statement
+    used as ``async with conn.execute(...)`` is reported when the block exits,
+    so the time includes fetching its rows. A plain ``await conn.execute(...)``
+    is reported as soon as it returns.
+    """
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, parameters=None):
+        return _ProfiledExecute(self._conn, self._profiler, sql, parameters)
+
+    async def execute_fetchall(self, sql, parameters=None):
+        started = time.perf_counter()
+        rows = await self._conn.execute_fetchall(sql, parameters)
+        self._profiler.record(sql, time.perf_counter() - started, len(rows))
+        return rows
+
+    async def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        cursor = await self._conn.executemany(sql, parameters)
+        self._profiler.record(sql, time.perf_counter() - started, cursor.rowcount)
+        return cursor
+
+
+class _ProfiledExecute:
+    def __init__(self, conn, profiler, sql, parameters):
+        self._conn = conn
+        self._profiler = profiler
+        self._sql = sql
+        self._parameters = parameters
+        self._cursor = None
+        self._started = 0.0
+
+    def __await__(self):
+        return self._run().__await__()
+
+    async def _run(self):
+        started = time.perf_counter()
+        cursor = await self._conn.execute(self._sql, self._parameters)
+        self._profiler.record(self._sql, time.perf_counter() - started, cursor.rowcount)
+        return cursor
+
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        self._cursor = _CountingCursor(await self._conn.execute(self._sql, self._parameters))
+        return self._cursor
+
+    async def __aexit__(self, *exc_info):
+        await self._cursor.close()
+        rows = self._cursor.fetched or self._cursor.rowcount
+        self._profiler.record(self._sql, time.perf_counter() - self._started, rows)
+
+
+class _CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.fetched = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        if row is not None:
+            self.fetched += 1
+        return row
+
+    async def fetchmany(self, size=None):
+        rows = await self._cursor.fetchmany(size) if size is not None else await self._cursor.fetchmany()
+        self.fetched += len(rows)
+        return rows
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        self.fetched += len(rows)
+        return rows
+
+
+# === Middleware ===
+class DatabaseMiddleware(BaseMiddleware):
+    """Hands the shared Database to every handler as the ``db`` argument."""
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["db"] = self.database
+        return await handler(event, data)
@@ -0,0 +1,199 @@
+import bisect
+import logging
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# === Metric types ===
+def _format_labels(labelnames, labels, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # Per-bucket counts, then sum and count
+            series = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            inf_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf_labels} {series[-1]}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {series[-2]}"
+            yield f"{self.name}_count{label_str} {series[-1]}"
+
+
+class Gauge:
+    """A value read from ``callback`` at scrape time; ``kind="counter"`` for running totals."""
+
+    def __init__(self, name, help, callback, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.callback()}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, callback, kind="gauge"):
+        return self._add(Gauge(name, help, callback, kind))
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    async def handle(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+# === Handler timing ===
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner middleware that times each router handler by function name."""
+
+    def __init__(self, registry: Registry):
+        self.seconds = registry.histogram("bot_handler_seconds", "Time spent in router handlers.", ("handler",))
+        self.errors = registry.counter("bot_handler_errors_total", "Router handlers that raised.", ("handler",))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(name)
+            raise
+        finally:
+            self.seconds.observe(time.perf_counter() - started, name)
+
+
+# === Outbound API timing ===
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that times every Bot API call by method."""
+
+    def __init__(self, registry: Registry):
+        self.seconds = registry.histogram("bot_api_seconds", "Bot API call latency.", ("method",))
+        self.errors = registry.counter("bot_api_errors_total", "Bot API calls that failed.", ("method", "error"))
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.seconds.observe(time.perf_counter() - started, name)
+
+
+# === SQL profiling ===
+class SQLProfiler:
+    """Per-statement SQLite timings and row counts, sampled per connection checkout.
+
+    Database.acquire() asks sampled() whether to wrap the connection it hands
+    out. Every statement run on a wrapped connection is recorded, and any that
+    takes longer than ``slow_ms`` is logged. The wait for a pooled connection
+    is cheap to measure, so it is recorded on every checkout.
+    """
+
+    def __init__(self, registry: Registry, sample_rate=0.1, slow_ms=100):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+        self.seconds = registry.histogram("bot_sql_seconds", "SQLite statement time, sampled.", ("statement",))
+        self.rows = registry.counter("bot_sql_rows_total", "Rows returned or changed by SQLite statements, sampled.", ("statement",))
+        self.wait = registry.histogram("bot_db_pool_wait_seconds", "Time spent waiting for a pooled connection.")
+        self._labels = {}
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record_wait(self, seconds):
+        self.wait.observe(seconds)
+
+    def record(self, sql, seconds, rows):
+        label = self._labels.get(sql)
+        if label is None:
+            label = self._labels[sql] = re.sub(r"\s+", " ", sql).strip()[:120]
+        self.seconds.observe(seconds, label)
+        if rows > 0:
+            self.rows.inc(label, amount=rows)
+        if seconds >= self.slow_seconds:
+            logger.warning("Slow query (%.1f ms, %d rows): %s", seconds * 1000, rows, label)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import DeleteMessage, SendMessage, SendPhoto
+
+logger = logging.getLogger(__name__)
+
+# Telegram's rate limits cover new messages, not edits or deletes
+RATE_LIMITED = (SendMessage, SendPhoto)
+
+
+# === Rate limiting ===
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+# === Outbound queue ===
+class _Job:
+    __slots__ = ("method", "dedupe_key", "attempts")
+
+    def __init__(self, method, dedupe_key):
+        self.method = method
+        self.dedupe_key = dedupe_key
+        self.attempts = 0
+
+
+class Outbox:
+    """Asynchronous, rate-limited delivery of outbound Bot API calls.
+
+    Handlers enqueue with send_message()/send_photo()/delete_message() and
+    return at once. Workers deliver the calls with the following rules:
+
+    * Calls to the same chat are sent in order, one at a time.
+    * Messages and photos draw on a token bucket per chat and on a global
+      one shared by all chats. Deletes skip both; a 429 still holds them
+      back for ``retry_after``.
+    * At most ``concurrency`` calls are in flight at once.
+    * After a 429, the chat waits ``retry_after`` seconds before retrying.
+      Network and server errors back off exponentially, up to
+      ``max_attempts`` tries in total.
+
+    A call with a ``dedupe_key`` is dropped while an identical key for the
+    same chat is still queued or in flight.
+    """
+
+    def __init__(self, bot, concurrency=8, global_rate=25, chat_rate=1, chat_burst=5, max_attempts=5, max_pending=10000):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets = {}
+        self._chats = {}
+        self._keys = set()
+        self._ready = None
+        self._workers = []
+        self._pending = 0
+        self._idle = None
+
+    # --- Enqueueing ---
+    def send_message(self, chat_id, text, dedupe_key=None, **kwargs):
+        return self.enqueue(SendMessage(chat_id=chat_id, text=text, **kwargs), chat_id, dedupe_key)
+
+    def send_photo(self, chat_id, photo, dedupe_key=None, **kwargs):
+        return self.enqueue(SendPhoto(chat_id=chat_id, photo=photo, **kwargs), chat_id, dedupe_key)
+
+    def delete_message(self, chat_id, message_id):
+        return self.enqueue(DeleteMessage(chat_id=chat_id, message_id=message_id), chat_id)
+
+    def enqueue(self, method, chat_id, dedupe_key=None):
+        if dedupe_key is not None:
+            if (chat_id, dedupe_key) in self._keys:
+                return False
+            self._keys.add((chat_id, dedupe_key))
+        if self._pending >= self.max_pending:
+            logger.warning("Outbox full, dropping %s to chat %s", type(method).__name__, chat_id)
+            self._keys.discard((chat_id, dedupe_key))
+            return False
+
+        self._pending += 1
+        self._idle.clear()
+        jobs = self._chats.get(chat_id)
+        if jobs is None:
+            jobs = self._chats[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        jobs.append(_Job(method, dedupe_key))
+        return True
+
+    @property
+    def pending(self):
+        return self._pending
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self, timeout=10):
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox closed with %d calls undelivered", self._pending)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # --- Delivery ---
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._deliver_next(chat_id)
+            except Exception:
+                logger.exception("Outbox worker failed on chat %s", chat_id)
+
+    async def _deliver_next(self, chat_id):
+        jobs = self._chats[chat_id]
+        job = jobs[0]
+
+        if isinstance(job.method, RATE_LIMITED):
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = max(bucket.delay(), self._global.delay())
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = max(bucket.delay(), self._global.delay())
+            bucket.take()
+            self._global.take()
+
+        job.attempts += 1
+        retry_in = None
+        try:
+            await self.bot(job.method)
+        except TelegramRetryAfter as e:
+            retry_in = e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            retry_in = min(2 ** job.attempts, 60)
+            logger.warning("Outbox %s to chat %s failed: %s", type(job.method).__name__, chat_id, e)
+        except TelegramAPIError as e:
+            # Blocked bot, deleted message, bad request: retrying won't help
+            logger.info("Outbox %s to chat %s rejected: %s", type(job.method).__name__, chat_id, e)
+        except Exception:
+            logger.exception("Outbox %s to chat %s failed", type(job.method).__name__, chat_id)
+
+        if retry_in is not None and job.attempts < self.max_attempts:
+            asyncio.get_running_loop().call_later(retry_in, self._ready.put_nowait, chat_id)
+            return
+
+        jobs.popleft()
+        self._keys.discard((chat_id, job.dedupe_key))
+        self._pending -= 1
+        if jobs:
+            self._ready.put_nowait(chat_id)
+        else:
+            del self._chats[chat_id]
+            self._prune_buckets()
+            if not self._pending:
+                self._idle.set()
+
+    def _prune_buckets(self):
+        if len(self._buckets) > 4 * self.max_pending:
+            self._buckets = {
+                chat_id: bucket for chat_id, bucket in self._buckets.items()
+                if chat_id in self._chats or not bucket.idle
+            }
@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+
+# === SQLite FSM storage ===
+class _Record:
+    __slots__ = ("state", "data", "expires_at", "updated_at")
+
+    def __init__(self, state=None, data=None, expires_at=0, updated_at=0.0):
+        self.state = state
+        self.data = data or {}
+        self.expires_at = expires_at
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage kept in an ``fsm`` table of the bot database.
+
+    Writes land in an in-memory buffer that is flushed to SQLite every
+    ``flush_interval`` seconds and on close(). Reads check the buffer first,
+    so a process always sees its own writes. States expire ``state_ttl``
+    seconds after their last write; expired rows are ignored when read and
+    purged in the background.
+
+    The buffer assumes one bot process per database. A second process reads
+    what has been flushed, which can be up to ``flush_interval`` seconds
+    behind. Every row carries the time of its last write, and a flush never
+    replaces a row written later, so a late flush cannot undo a newer state.
+    When several processes share the database, use ``flush_interval=0`` to
+    write each change through as it is made.
+    """
+
+    def __init__(self, database, state_ttl=7 * 24 * 3600, flush_interval=0.5, purge_interval=600):
+        self.database = database
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._dirty: Dict[str, _Record] = {}
+        self._flushing: Dict[str, _Record] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    async def open(self):
+        async with self.database.transaction() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS fsm (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    expires_at INTEGER,
+                    updated_at REAL NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            """)
+            async with conn.execute("PRAGMA table_info(fsm)") as cursor:
+                columns = {row[1] for row in await cursor.fetchall()}
+            if "updated_at" not in columns:
+                await conn.execute("ALTER TABLE fsm ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            await conn.execute("CREATE INDEX IF NOT EXISTS fsm_expires_idx ON fsm (expires_at)")
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def close(self) -> None:
+        if self._flusher is None:
+            return
+        flusher, self._flusher = self._flusher, None
+        flusher.cancel()
+        # A flush cut short here puts its batch back for the final one below
+        with contextlib.suppress(asyncio.CancelledError):
+            await flusher
+        await self.flush()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record_for_write(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._write_through()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record_for_write(key)
+        record.data = data.copy()
+        await self._write_through()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self._key(key))).data.copy()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        # Reads fall back to these until the transaction below has committed
+        self._flushing = dirty
+        upserts = [
+            (key, record.state, json.dumps(record.data), int(record.expires_at), record.updated_at)
+            for key, record in dirty.items()
+            if record.state is not None or record.data
+        ]
+        # A cleared context leaves nothing worth keeping
+        deletes = [(key, record.updated_at) for key, record in dirty.items() if record.state is None and not record.data]
+        try:
+            async with self.database.transaction() as conn:
+                # Rows written later, e.g. by another process, are left alone
+                if upserts:
+                    await conn.executemany("""
+                        INSERT INTO fsm (key, state, data, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (key) DO UPDATE SET
+                            state = excluded.state, data = excluded.data,
+                            expires_at = excluded.expires_at, updated_at = excluded.updated_at
+                        WHERE excluded.updated_at >= fsm.updated_at
+                    """, upserts)
+                if deletes:
+                    await conn.executemany("DELETE FROM fsm WHERE key = ? AND updated_at <= ?", deletes)
+        except BaseException:
+            # Put the records back unless they were rewritten in the meantime
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def purge_expired(self):
+        async with self.database.transaction() as conn:
+            await conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (int(time.time()),))
+
+    async def _write_through(self):
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    async def _run_flusher(self):
+        # Writing through leaves only the purge for this loop
+        interval = self.flush_interval if self.flush_interval > 0 else self.purge_interval
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge >= self.purge_interval:
+                    self._last_purge = time.monotonic()
+                    await self.purge_expired()
+            except Exception:
+                logger.exception("FSM storage flush failed")
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _load(self, key: str) -> _Record:
+        record = self._dirty.get(key) or self._flushing.get(key)
+        if record is not None:
+            return record if record.expires_at > time.time() else _Record()
+        async with self.database.acquire() as conn:
+            async with conn.execute("SELECT state, data, expires_at, updated_at FROM fsm WHERE key = ? AND expires_at > ?", (key, int(time.time()))) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return _Record()
+        return _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2], row[3])
+
+    async def _record_for_write(self, key: StorageKey) -> _Record:
+        key = self._key(key)
+        record = self._dirty.get(key)
+        if record is None:
+            loaded = await self._load(key)
+            # Another write may have buffered this key while we were reading
+            record = self._dirty.setdefault(key, loaded)
+        elif record.expires_at <= time.time():
+            record = self._dirty[key] = _Record()
+        record.updated_at = time.time()
+        record.expires_at = record.updated_at + self.state_ttl
+        return record
+
+
+# === Backend selection ===
+def create_storage(url, database, **sqlite_options):
+    """Build the FSM storage named by ``url``: "sqlite", "memory" or a redis:// URL."""
+    if url == "sqlite":
+        return SQLiteStorage(database, **sqlite_options)
+    if url == "memory":
+        return MemoryStorage()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # Needs the optional "redis" package
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(url)
+    raise ValueError(f"Unknown FSM storage: {url!r}")
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+
+import pytest
+
+from candidates import CandidateQueue
+
+
+class StubFetch:
+    """Ranks candidates 1..profiles and leaves out the ones each user has swiped."""
+
+    def __init__(self, profiles=100, delay=0.0):
+        self.profiles = profiles
+        self.delay = delay
+        self.swiped = {}
+        self.limits = []
+        self.fail = None
+
+    async def __call__(self, db, user_id, limit):
+        self.limits.append(limit)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+        if user_id < 0:
+            raise LookupError(user_id)
+        swiped = self.swiped.get(user_id, set())
+        ranked = [target for target in range(1, self.profiles + 1) if target != user_id and target not in swiped]
+        return [(target, f"card {target}") for target in ranked[:limit]]
+
+    def swipe(self, user_id, target_id):
+        self.swiped.setdefault(user_id, set()).add(target_id)
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+async def settle():
+    # Let background refills finish
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_cards_come_in_rank_order_without_repeats():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=5, low_water=2)
+        shown = []
+        for _ in range(12):
+            card = await queue.next(None, 1000)
+            fetch.swipe(1000, card[0])
+            queue.discard(1000, card[0])
+            shown.append(card[0])
+            await settle()
+        return shown
+
+    assert run(scenario) == list(range(1, 13))
+
+
+def test_concurrent_next_shares_one_refill():
+    async def scenario():
+        fetch = StubFetch(delay=0.01)
+        queue = CandidateQueue(fetch, batch_size=5, low_water=0)
+        cards = await asyncio.gather(queue.next(None, 1000), queue.next(None, 1000))
+        return cards, fetch.limits
+
+    cards, limits = run(scenario)
+    assert {card[0] for card in cards} == {1, 2}
+    assert limits[0] == 5 and len(limits) <= 2
+
+
+def test_unswiped_card_comes_back_and_fetch_limit_stays_bounded():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=2, low_water=0)
+        # /find over and over without swiping
+        shown = [(await queue.next(None, 1000))[0] for _ in range(3)]
+        for _ in range(20):
+            await queue.next(None, 1000)
+            await settle()
+        return shown, fetch.limits
+
+    shown, limits = run(scenario)
+    assert shown[:2] == [1, 2]
+    assert shown[2] == 1
+    # batch_size + low_water queued + the card on screen
+    assert max(limits) <= 2 + 0 + 1
+
+
+def test_discard_drops_queued_card():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=5, low_water=0)
+        first = await queue.next(None, 1000)
+        # Swiped from an older message, while card 3 is still queued
+        fetch.swipe(1000, 3)
+        queue.discard(1000, 3)
+        fetch.swipe(1000, first[0])
+        queue.discard(1000, first[0])
+        return [(await queue.next(None, 1000))[0] for _ in range(3)]
+
+    assert run(scenario) == [2, 4, 5]
+
+
+def test_invalidate_profile_drops_the_users_queue_and_their_card():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=5, low_water=0)
+        await queue.next(None, 1000)  # queues 2..5 for user 1000
+        await queue.next(None, 3)  # user 3's own queue
+        calls = len(fetch.limits)
+        queue.invalidate_profile(3)
+        next_for_1000 = await queue.next(None, 1000)
+        following = await queue.next(None, 1000)
+        await queue.next(None, 3)
+        return next_for_1000[0], following[0], len(fetch.limits) - calls
+
+    next_card, following, new_fetches = run(scenario)
+    assert (next_card, following) == (2, 4)
+    # User 1000's queue was kept; user 3's was rebuilt
+    assert new_fetches == 1
+
+
+def test_expired_queue_is_fetched_again():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=5, low_water=0, ttl=0)
+        await queue.next(None, 1000)
+        await queue.next(None, 1000)
+        return len(fetch.limits)
+
+    assert run(scenario) == 2
+
+
+def test_least_recently_used_queue_is_evicted():
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=5, low_water=0, max_users=2)
+        await queue.next(None, 1000)
+        await queue.next(None, 2000)
+        await queue.next(None, 1000)  # 1000 is now the most recent
+        await queue.next(None, 3000)  # evicts 2000
+        calls = len(fetch.limits)
+        await queue.next(None, 1000)
+        kept = len(fetch.limits) == calls
+        await queue.next(None, 2000)
+        return kept, len(fetch.limits) == calls + 1
+
+    assert run(scenario) == (True, True)
+
+
+def test_missing_profile_raises_lookup_error():
+    async def scenario():
+        queue = CandidateQueue(StubFetch(), batch_size=5)
+        with pytest.raises(LookupError):
+            await queue.next(None, -1)
+        with pytest.raises(LookupError):
+            await queue.next(None, -1)
+
+    run(scenario)
+
+
+def test_failed_prefetch_is_logged_and_retried(caplog):
+    async def scenario():
+        fetch = StubFetch()
+        queue = CandidateQueue(fetch, batch_size=3, low_water=2)
+        await queue.next(None, 1000)  # leaves 2 queued and starts a prefetch
+        fetch.fail = RuntimeError("database is locked")
+        await settle()
+        cards = [(await queue.next(None, 1000))[0] for _ in range(3)]
+        await queue.close()
+        return cards
+
+    with caplog.at_level(logging.WARNING, logger="candidates"):
+        cards = run(scenario)
+    assert "Candidate prefetch failed" in caplog.text
+    assert cards[:2] == [2, 3] and cards[2] not in (2, 3)
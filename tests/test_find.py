@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sqlite3
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import bot  # noqa: E402
+from db import Database  # noqa: E402
+
+SEARCHER = 1
+# Candidates due north of the searcher, by distance
+NEAR, TOWN, REGION, FAR = 2, 3, 4, 5
+LIKED, WRONG_INTEREST, NO_LOCATION = 6, 7, 8
+
+
+def legacy_db(path):
+    """A database in the original schema: no lat/lon, raw keyboard labels, likes only."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            gender TEXT,
+            interested_in TEXT,
+            photo_id TEXT,
+            bio TEXT,
+            location TEXT
+        );
+        CREATE TABLE likes (
+            liker_id INTEGER,
+            liked_id INTEGER,
+            PRIMARY KEY (liker_id, liked_id)
+        );
+    """)
+    profiles = [
+        (SEARCHER, "👨 Man", "👩 Women", "25.0,55.0"),
+        (NEAR, "👩 Woman", "👨 Men", "25.009,55.0"),  # ~1 km
+        (TOWN, "Female", "🔀 Both", "25.09,55.0"),  # ~10 km
+        (REGION, "👩 Woman", "Men", "25.45,55.0"),  # ~50 km
+        (FAR, "👩 Woman", "👨 Men", "34.0,55.0"),  # ~1000 km, past the last radius
+        (LIKED, "👩 Woman", "👨 Men", "25.001,55.0"),
+        (WRONG_INTEREST, "👩 Woman", "👩 Women", "25.002,55.0"),
+        (NO_LOCATION, "👩 Woman", "👨 Men", "unknown"),
+    ]
+    conn.executemany(
+        "INSERT INTO users (user_id, gender, interested_in, photo_id, bio, location) VALUES (?, ?, ?, ?, ?, ?)",
+        [(user_id, gender, interest, f"photo-{user_id}", f"bio {user_id}", location) for user_id, gender, interest, location in profiles],
+    )
+    conn.executemany("INSERT INTO likes VALUES (?, ?)", [(SEARCHER, LIKED), (LIKED, SEARCHER), (NEAR, SEARCHER)])
+    conn.commit()
+    conn.close()
+
+
+def migrate_and_find(path, limits):
+    async def scenario():
+        database = Database(str(path), pool_size=1)
+        await database.open()
+        try:
+            # A restart runs the migration again
+            await bot.create_db(database)
+            await bot.create_db(database)
+            async with database.acquire() as conn:
+                users = {row[0]: tuple(row[1:]) for row in await conn.execute_fetchall("SELECT user_id, gender, interested_in, lat, lon FROM users")}
+                geo = sorted(row[0] for row in await conn.execute_fetchall("SELECT user_id FROM users_geo"))
+                swipes = sorted(tuple(row) for row in await conn.execute_fetchall("SELECT swiper_id, target_id, action FROM swipes"))
+                matches = sorted(tuple(row) for row in await conn.execute_fetchall("SELECT user_id, match_id FROM matches"))
+            found = {limit: [row[0] for row in await bot.fetch_candidates(database, SEARCHER, limit)] for limit in limits}
+            return users, geo, swipes, matches, found
+        finally:
+            await database.close()
+
+    return asyncio.run(scenario())
+
+
+def test_migration_backfills_coordinates_labels_and_index(tmp_path):
+    path = tmp_path / "users.db"
+    legacy_db(path)
+    users, geo, swipes, matches, _ = migrate_and_find(path, ())
+
+    assert users[SEARCHER] == ("Male", "Women", 25.0, 55.0)
+    assert users[NEAR] == ("Female", "Men", 25.009, 55.0)
+    assert users[TOWN][:2] == ("Female", "Both")
+    assert users[NO_LOCATION][2:] == (None, None)
+    assert geo == [user_id for user_id in sorted(users) if user_id != NO_LOCATION]
+    # Likes recorded before swipes existed count as seen, and mutual ones as matches
+    assert swipes == sorted([(SEARCHER, LIKED, "like"), (LIKED, SEARCHER, "like"), (NEAR, SEARCHER, "like")])
+    assert matches == [(SEARCHER, LIKED), (LIKED, SEARCHER)]
+
+
+def test_candidates_nearest_first_widening_past_the_last_radius(tmp_path):
+    path = tmp_path / "users.db"
+    legacy_db(path)
+    *_, found = migrate_and_find(path, (1, 2, 3, 10))
+
+    assert found[1] == [NEAR]
+    assert found[2] == [NEAR, TOWN]
+    assert found[3] == [NEAR, TOWN, REGION]
+    # Past the last radius everyone eligible is a candidate, still nearest first
+    assert found[10] == [NEAR, TOWN, REGION, FAR]
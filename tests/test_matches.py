@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import bot  # noqa: E402
+from db import Database  # noqa: E402
+
+
+def run_swipes(path, swipes):
+    """Apply ``swipes`` in order; return each one's match flag and the final matches table."""
+    async def scenario():
+        database = Database(str(path), pool_size=1)
+        await database.open()
+        try:
+            await bot.create_db(database)
+            results = [await bot.record_swipe(database, *swipe) for swipe in swipes]
+            async with database.acquire() as conn:
+                matches = await conn.execute_fetchall("SELECT user_id, match_id FROM matches ORDER BY user_id")
+            return results, [tuple(row) for row in matches]
+        finally:
+            await database.close()
+
+    return asyncio.run(scenario())
+
+
+def test_mutual_like_reports_one_match(tmp_path):
+    results, matches = run_swipes(tmp_path / "bot.db", [(1, 2, "like"), (2, 1, "like")])
+    assert results == [False, True]
+    assert matches == [(1, 2), (2, 1)]
+
+
+def test_repeated_like_does_not_report_the_match_again(tmp_path):
+    results, _ = run_swipes(tmp_path / "bot.db", [(1, 2, "like"), (2, 1, "like"), (2, 1, "like"), (1, 2, "like")])
+    assert results == [False, True, False, False]
+
+
+def test_like_after_skip_counts(tmp_path):
+    results, matches = run_swipes(tmp_path / "bot.db", [(1, 2, "like"), (2, 1, "skip"), (2, 1, "like")])
+    assert results == [False, False, True]
+    assert matches == [(1, 2), (2, 1)]
+
+
+def test_relike_after_skip_is_not_a_new_match(tmp_path):
+    results, _ = run_swipes(tmp_path / "bot.db", [(1, 2, "like"), (2, 1, "like"), (2, 1, "skip"), (2, 1, "like")])
+    assert results == [False, True, False, False]
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp.test_utils import TestServer
+
+from bench.fake_api import FakeTelegramAPI
+from outbox import Outbox
+
+
+def run(scenario, **api_options):
+    """Run ``scenario(api, bot)`` against a fake Bot API and return its result."""
+    async def main():
+        api = FakeTelegramAPI(**api_options)
+        server = TestServer(api.app)
+        await server.start_server()
+        bot = Bot("123456:TEST", session=AiohttpSession(api=TelegramAPIServer.from_base(str(server.make_url("/")))))
+        try:
+            return await scenario(api, bot)
+        finally:
+            await bot.session.close()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_calls_to_a_chat_go_out_in_order():
+    async def scenario(api, bot):
+        outbox = Outbox(bot, chat_rate=100, chat_burst=10)
+        await outbox.start()
+        for i in range(5):
+            outbox.send_message(1, f"message {i}")
+        outbox.delete_message(1, 42)
+        outbox.send_message(2, "other chat")
+        await outbox.close()
+        return api.sent
+
+    sent = run(scenario)
+    assert [text for method, chat_id, text in sent if chat_id == 1] == [f"message {i}" for i in range(5)] + [None]
+    assert ("sendMessage", 2, "other chat") in sent
+
+
+def test_retry_after_redelivers():
+    async def scenario(api, bot):
+        outbox = Outbox(bot, chat_rate=100, chat_burst=10)
+        await outbox.start()
+        outbox.send_message(1, "first")
+        outbox.send_message(1, "second")
+        await outbox.close()
+        return api.sent, api.floods
+
+    sent, floods = run(scenario, flood_every=2, retry_after=1)
+    assert floods == 1
+    assert [text for _, _, text in sent] == ["first", "second"]
+
+
+def test_dedupe_key_drops_queued_duplicates():
+    async def scenario(api, bot):
+        outbox = Outbox(bot)
+        await outbox.start()
+        queued = [outbox.send_message(1, "🔥 It's a match!", dedupe_key="match:2") for _ in range(3)]
+        await outbox.close()
+        return queued, api.calls["sendMessage"]
+
+    assert run(scenario) == ([True, False, False], 1)
+
+
+def test_deletes_do_not_use_rate_tokens():
+    async def scenario(api, bot):
+        # One token per chat: a rate-limited delete would hold the card back a second
+        outbox = Outbox(bot, chat_rate=1, chat_burst=1)
+        await outbox.start()
+        started = time.perf_counter()
+        outbox.delete_message(1, 42)
+        outbox.send_photo(1, "photo", caption="next card")
+        await outbox.close()
+        return time.perf_counter() - started, [method for method, _, _ in api.sent]
+
+    elapsed, methods = run(scenario)
+    assert methods == ["deleteMessage", "sendPhoto"]
+    assert elapsed < 0.5
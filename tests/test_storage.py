@@ -0,0 +1,127 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from db import Database
+from storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class WatchedDatabase(Database):
+    """Database that reports every caller asking for the write lock."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writers = asyncio.Queue()
+
+    def transaction(self):
+        self.writers.put_nowait(None)
+        return super().transaction()
+
+
+async def _open(path, **options):
+    database = WatchedDatabase(str(path), pool_size=2)
+    await database.open()
+    storage = SQLiteStorage(database, **{"flush_interval": 0.01, "purge_interval": float("inf"), **options})
+    await storage.open()
+    return database, storage
+
+
+def test_close_flushes_buffered_writes(tmp_path):
+    async def scenario():
+        database, storage = await _open(tmp_path / "fsm.db")
+        storage.flush_interval = 3600
+        await storage.set_state(KEY, "Form:bio")
+        await storage.set_data(KEY, {"name": "bench"})
+        await storage.close()
+
+        storage = SQLiteStorage(database)
+        await storage.open()
+        try:
+            return await storage.get_state(KEY), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+            await database.close()
+
+    assert run(scenario()) == ("Form:bio", {"name": "bench"})
+
+
+def test_close_during_flush_keeps_the_batch(tmp_path):
+    async def scenario():
+        database, storage = await _open(tmp_path / "fsm.db")
+        held, release = asyncio.Event(), asyncio.Event()
+
+        async def hold_write_lock():
+            async with database.transaction():
+                held.set()
+                await release.wait()
+
+        blocker = asyncio.create_task(hold_write_lock())
+        await held.wait()
+        while not database.writers.empty():
+            database.writers.get_nowait()
+        await storage.set_state(KEY, "Form:photo")
+        # The background flusher picks the record up and waits for the lock
+        await database.writers.get()
+
+        closing = asyncio.create_task(storage.close())
+        # close() has cancelled that flush and is waiting to write the batch itself
+        await database.writers.get()
+        release.set()
+        await asyncio.gather(blocker, closing)
+
+        storage = SQLiteStorage(database)
+        await storage.open()
+        try:
+            return await storage.get_state(KEY)
+        finally:
+            await storage.close()
+            await database.close()
+
+    assert run(scenario()) == "Form:photo"
+
+
+def test_late_flush_does_not_undo_a_newer_write(tmp_path):
+    async def scenario():
+        # Two processes sharing one database, each with its own buffer
+        database, first = await _open(tmp_path / "fsm.db", flush_interval=3600)
+        second = SQLiteStorage(database, flush_interval=3600)
+        await second.open()
+        await first.set_state(KEY, "Form:bio")
+        await asyncio.sleep(0.01)
+        await second.set_state(KEY, "Form:photo")
+        await second.flush()
+        await first.flush()
+
+        reader = SQLiteStorage(database)
+        await reader.open()
+        try:
+            return await reader.get_state(KEY)
+        finally:
+            for storage in (first, second, reader):
+                await storage.close()
+            await database.close()
+
+    assert run(scenario()) == "Form:photo"
+
+
+def test_write_through_is_visible_to_other_processes(tmp_path):
+    async def scenario():
+        database, writer = await _open(tmp_path / "fsm.db", flush_interval=0)
+        reader = SQLiteStorage(database, flush_interval=0)
+        await reader.open()
+        try:
+            await writer.set_state(KEY, "Form:bio")
+            await writer.set_data(KEY, {"name": "bench"})
+            return await reader.get_state(KEY), await reader.get_data(KEY)
+        finally:
+            await writer.close()
+            await reader.close()
+            await database.close()
+
+    assert run(scenario()) == ("Form:bio", {"name": "bench"})
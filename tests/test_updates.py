@@ -0,0 +1,117 @@
+import asyncio
+import random
+
+from aiogram import Bot
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from updates import QueuedRequestHandler, UpdateQueue
+
+
+class StubDispatcher:
+    """Stands in for aiogram's Dispatcher; records updates and can hold chosen senders."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.handled = []
+        self.active = 0
+        self.max_active = 0
+        self.gates = {}
+
+    async def feed_raw_update(self, bot, update, **data):
+        sender = update["message"]["from"]["id"]
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if sender in self.gates:
+                await self.gates[sender].wait()
+            if self.delay:
+                await asyncio.sleep(random.uniform(0, self.delay))
+            self.handled.append((sender, update["update_id"]))
+        finally:
+            self.active -= 1
+
+
+def message(update_id, sender):
+    return {"update_id": update_id, "message": {"message_id": update_id, "from": {"id": sender}, "chat": {"id": sender}}}
+
+
+def test_updates_from_one_sender_stay_in_order():
+    async def scenario():
+        dispatcher = StubDispatcher(delay=0.005)
+        queue = UpdateQueue(dispatcher, bot=None, workers=4, max_size=1000)
+        await queue.start()
+        for update_id in range(200):
+            assert queue.submit(message(update_id, sender=update_id % 5))
+        await queue.drain()
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert len(dispatcher.handled) == 200
+    assert dispatcher.max_active > 1
+    for sender in range(5):
+        ids = [update_id for who, update_id in dispatcher.handled if who == sender]
+        assert ids == sorted(ids)
+
+
+def test_busy_sender_does_not_block_others():
+    async def scenario():
+        dispatcher = StubDispatcher()
+        dispatcher.gates[1] = asyncio.Event()
+        queue = UpdateQueue(dispatcher, bot=None, workers=2, max_size=100)
+        await queue.start()
+        for update_id in range(3):
+            queue.submit(message(update_id, sender=1))
+        for update_id in range(3, 10):
+            queue.submit(message(update_id, sender=update_id))
+        while len(dispatcher.handled) < 7:
+            await asyncio.sleep(0.001)
+        handled_while_blocked = list(dispatcher.handled)
+        dispatcher.gates[1].set()
+        await queue.drain()
+        return handled_while_blocked, dispatcher.handled
+
+    blocked, handled = asyncio.run(scenario())
+    assert {sender for sender, _ in blocked} == set(range(3, 10))
+    assert [update_id for sender, update_id in handled if sender == 1] == [0, 1, 2]
+
+
+def test_full_queue_answers_503():
+    async def scenario():
+        dispatcher = StubDispatcher()
+        dispatcher.gates[1] = asyncio.Event()
+        queue = UpdateQueue(dispatcher, bot=None, workers=1, max_size=2)
+        await queue.start()
+        handler = QueuedRequestHandler(dispatcher, Bot("123456:TEST"), queue, secret_token="secret")
+        app = web.Application()
+        app.router.add_post("/webhook", handler.handle)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+        async with TestClient(TestServer(app)) as client:
+            statuses = []
+            for update_id in range(4):
+                response = await client.post("/webhook", json=message(update_id, sender=1), headers=headers)
+                statuses.append(response.status)
+                # Let the worker pick up the first update
+                await asyncio.sleep(0.01)
+            dispatcher.gates[1].set()
+            await queue.drain()
+        await handler.close()
+        return statuses, queue.stats()
+
+    statuses, stats = asyncio.run(scenario())
+    # One update in flight and two waiting fill the queue; the fourth is turned away
+    assert statuses == [200, 200, 200, 503]
+    assert stats["rejected"] == 1 and stats["processed"] == 3
+
+
+def test_drain_finishes_queued_work_and_rejects_new_updates():
+    async def scenario():
+        dispatcher = StubDispatcher(delay=0.01)
+        queue = UpdateQueue(dispatcher, bot=None, workers=2, max_size=100)
+        await queue.start()
+        for update_id in range(20):
+            queue.submit(message(update_id, sender=update_id % 3))
+        await queue.drain()
+        return len(dispatcher.handled), queue.submit(message(99, sender=1)), queue.depth
+
+    assert asyncio.run(scenario()) == (20, False, 0)
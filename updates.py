@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+# === Update worker pool ===
+def _update_owner(update):
+    # Raw update dicts carry exactly one payload, e.g. {"update_id": ..., "message": {...}}
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        sender = payload.get("from") or payload.get("user") or payload.get("chat")
+        if sender is None and isinstance(payload.get("message"), dict):
+            sender = payload["message"].get("chat")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return update.get("update_id", 0)
+
+
+class UpdateQueue:
+    """Bounded in-process queue of webhook updates served by a worker pool.
+
+    Up to ``max_size`` updates wait in the queue. Each sender has its own
+    chain of updates, and only one of them is handled at a time, so a user's
+    updates run in order. Any free worker takes the next sender that has work,
+    so one busy user doesn't hold up the others. submit() never blocks; it
+    returns False when the queue is full or draining. The webhook turns that
+    into a 503, and Telegram retries later.
+    """
+
+    def __init__(self, dispatcher, bot, workers=8, max_size=1000, **data):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = workers
+        self.max_size = max_size
+        self.data = data
+        self._owners = {}
+        self._ready = None
+        self._idle = None
+        self._tasks = []
+        self._queued = 0
+        self._closing = False
+
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def start(self):
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, update):
+        self.received += 1
+        if self._closing or not self._tasks or self._queued >= self.max_size:
+            self.rejected += 1
+            return False
+        owner = _update_owner(update)
+        chain = self._owners.get(owner)
+        if chain is None:
+            # A sender that is already being served is picked up again when its update finishes
+            chain = self._owners[owner] = deque()
+            self._ready.put_nowait(owner)
+        chain.append((time.monotonic(), update))
+        self._queued += 1
+        self._idle.clear()
+        self.max_depth = max(self.max_depth, self._queued)
+        return True
+
+    @property
+    def depth(self):
+        return self._queued
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "wait_avg": self.wait_total / self.processed if self.processed else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    async def drain(self, timeout=30):
+        """Stop accepting updates and finish the queued ones."""
+        self._closing = True
+        if self._idle is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Update queue drain timed out with %d updates left", self.depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            owner = await self._ready.get()
+            chain = self._owners[owner]
+            queued_at, update = chain.popleft()
+            self._queued -= 1
+            waited = time.monotonic() - queued_at
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                result = await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Failed to process update %s", update.get("update_id"))
+            finally:
+                if chain:
+                    self._ready.put_nowait(owner)
+                else:
+                    del self._owners[owner]
+                    if not self._owners:
+                        self._idle.set()
+
+
+# === Webhook handler ===
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that checks the secret, enqueues the update and acks at once."""
+
+    def __init__(self, dispatcher, bot, queue, secret_token=None, **data):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.queue = queue
+
+    async def _handle_request_background(self, bot, request):
+        update = await request.json(loads=bot.session.json_loads)
+        if not self.queue.submit(update):
+            return web.Response(status=503, text="Busy")
+        return web.json_response({}, dumps=bot.session.json_dumps)